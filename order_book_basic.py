@@ -1,108 +1,165 @@
 import pandas as pd
 import numpy as np
+from pathlib import Path
 
-def run_energy_market_simulation(input_file, p2p_output, report_output, alpha=0.5):
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+def load_order_book(input_file):
+    # Parsing .xlsx is slow, so keep a Parquet copy next to the input and reuse it
+    # for as long as it is newer than the spreadsheet (skipped without pyarrow)
+    source = Path(input_file)
+    cache = source.with_suffix('.parquet')
+    if pa is not None and cache.exists() and cache.stat().st_mtime > source.stat().st_mtime:
+        try:
+            df = pd.read_parquet(cache, engine='pyarrow')
+        except (OSError, pa.ArrowException):
+            df = None  # Unreadable cache: rebuild it from the spreadsheet
+        # Restore the original column labels (agent ids are read in as ints)
+        labels = None if df is None else df.attrs.pop('column_labels', None)
+        if labels is not None:
+            df.columns = labels
+            return df
+
+    df = pd.read_excel(source)
+    if pa is not None:
+        # Parquet requires string column names, so write a relabelled copy and keep
+        # the real labels in its metadata. The cache is best-effort: unconvertible
+        # data or an unwritable directory just means running uncached. Writing to a
+        # temp file and renaming it means an interrupted run never leaves a
+        # truncated cache behind.
+        cached = df.rename(columns=str)
+        cached.attrs['column_labels'] = df.columns.tolist()
+        tmp = cache.with_suffix('.tmp.parquet')
+        try:
+            cached.to_parquet(tmp, engine='pyarrow', index=False)
+            tmp.replace(cache)
+        except (OSError, TypeError, ValueError, pa.ArrowException):
+            tmp.unlink(missing_ok=True)
+    return df
+
+METADATA_COLS = ['timestamp', 'export price', 'import price']
+
+def precompute_matches(df, dtype=np.float64):
+    # Matched volumes and grid remainders do not depend on alpha (it only sets the
+    # P2P price), so they can be computed once and re-priced for any alpha.
+    # dtype=np.float32 halves memory traffic on large inputs at ~7 significant digits
+    metadata_set = set(METADATA_COLS)
+    agent_ids = [col for col in df.columns if col not in metadata_set]
+
+    # Pull the raw arrays out once; every period is settled in one 2-D pass
+    agent_mat = df[agent_ids].to_numpy(dtype=dtype)
+    # Blank cells are neither a buy nor a sell order
+    agent_mat = np.where(np.isnan(agent_mat), 0.0, agent_mat)
+    fit_arr = df['export price'].to_numpy(dtype=dtype)
+    tou_arr = df['import price'].to_numpy(dtype=dtype)
+
+    # Split each period into buy (import) and sell (export) quantities per agent
+    buy_mat = np.maximum(agent_mat, 0)
+    sell_mat = np.maximum(-agent_mat, 0)
+
+    # Rationality Guard: If no benefit exists (ToU <= FiT), nothing is matched and
+    # everyone uses the Grid
+    rational = (tou_arr > fit_arr)[:, None]
+    matched = np.minimum(buy_mat.sum(axis=1, keepdims=True), sell_mat.sum(axis=1, keepdims=True))
+    matched = np.where(rational, matched, 0.0)
+
+    # FCFS Matching as a prefix-sum problem: every trade in a period clears at the
+    # same price and the only priority is agent order, so the cumulative buy and
+    # sell volumes are the demand and supply curves, and the market clears
+    # min(total buy, total sell). Walking the orders pair by pair fills each agent
+    # with exactly the part of [curve - own qty, curve] that lies below that
+    # cleared volume:
+    #   fill = clip(curve, 0, cleared) - clip(curve - own_qty, 0, cleared)
+    cum_b = np.cumsum(buy_mat, axis=1)
+    cum_s = np.cumsum(sell_mat, axis=1)
+    matched_b = np.clip(cum_b, 0, matched) - np.clip(cum_b - buy_mat, 0, matched)
+    matched_s = np.clip(cum_s, 0, matched) - np.clip(cum_s - sell_mat, 0, matched)
+
+    # Grid Settlement for unmatched quantities. The clip differences cancel to
+    # +/-1e-16 noise for fully matched orders, so apply the FCFS loop's 1e-9
+    # tolerance: a remainder below it counts as filled
+    grid_b = buy_mat - matched_b
+    grid_s = sell_mat - matched_s
+    grid_b = np.where(grid_b < 1e-9, 0.0, grid_b)
+    grid_s = np.where(grid_s < 1e-9, 0.0, grid_s)
+    matched_b = buy_mat - grid_b
+    matched_s = sell_mat - grid_s
+
+    return {
+        'agent_ids': agent_ids,
+        'fit': fit_arr,
+        'tou': tou_arr,
+        'buy': buy_mat,
+        'sell': sell_mat,
+        'matched_b': matched_b,
+        'matched_s': matched_s,
+        'grid_b': grid_b,
+        'grid_s': grid_s,
+    }
+
+def settle_financials(matches, alpha=0.5):
+    fit_arr = matches['fit']
+    tou_arr = matches['tou']
+
+    # Calculate P2P Price (Will be 0 if FiT/ToU are centered around 0)
+    p2p_price = fit_arr + alpha * (tou_arr - fit_arr)
+
+    # Financials (P2P Trade + Grid); adding 0.0 turns -0.0 into 0.0
+    return ((matches['matched_s'] - matches['matched_b']) * p2p_price[:, None]
+            - matches['grid_b'] * tou_arr[:, None]
+            + matches['grid_s'] * fit_arr[:, None]) + 0.0
+
+def run_energy_market_simulation(input_file, p2p_output, report_output, alpha=0.5, dtype=np.float64):
     # 1. Load Data
-    # Note: Use pd.read_excel(input_file) for .xlsx files
-    df = pd.read_excel(input_file)
-
-    metadata_cols = ['timestamp', 'export price', 'import price']
-    agent_ids = [col for col in df.columns if col not in metadata_cols]
-    
-    # Containers for results
-    p2p_financials = df.copy()
-    for agent in agent_ids: 
-        p2p_financials[agent] = 0.0
-    
-    # Metrics tracking for the summary report
-    metrics = {agent: {'p2p_kWh': 0.0, 'grid_kWh': 0.0, 'baseline_net': 0.0, 'p2p_net': 0.0} for agent in agent_ids}
-
-    # 2. Simulation Loop
-    for index, row in df.iterrows():
-        fit = row['export price']
-        tou = row['import price']
-        
-        # Calculate Baseline (Grid-Only) for this period
-        for agent in agent_ids:
-            qty = row[agent]
-            if qty > 0: # Agent buys from Grid
-                metrics[agent]['baseline_net'] -= qty * tou
-            else: # Agent sells to Grid
-                metrics[agent]['baseline_net'] += abs(qty) * fit
-
-        # --- P2P Market Logic ---
-        if tou <= fit:
-            # Rationality Guard: If no benefit exists, everyone uses the Grid
-            for agent in agent_ids:
-                qty = row[agent]
-                val = -qty * tou if qty > 0 else abs(qty) * fit
-                p2p_financials.at[index, agent] = val
-                metrics[agent]['p2p_net'] += val
-                metrics[agent]['grid_kWh'] += abs(qty)
-        else:
-            # Calculate P2P Price (Will be 0 if FiT/ToU are centered around 0)
-            p2p_price = fit + alpha * (tou - fit)
-
-            buy_orders = [[a, row[a]] for a in agent_ids if row[a] > 0]
-            sell_orders = [[a, abs(row[a])] for a in agent_ids if row[a] < 0]
-
-            # FCFS Matching
-            b_idx, s_idx = 0, 0
-            while b_idx < len(buy_orders) and s_idx < len(sell_orders):
-                b_id, b_qty = buy_orders[b_idx]
-                s_id, s_qty = sell_orders[s_idx]
-                
-                trade_qty = min(b_qty, s_qty)
-                
-                # Financials (P2P Trade)
-                p2p_financials.at[index, b_id] -= trade_qty * p2p_price
-                p2p_financials.at[index, s_id] += trade_qty * p2p_price
-                metrics[b_id]['p2p_net'] -= trade_qty * p2p_price
-                metrics[s_id]['p2p_net'] += trade_qty * p2p_price
-                
-                # Volume Tracking
-                metrics[b_id]['p2p_kWh'] += trade_qty
-                metrics[s_id]['p2p_kWh'] += trade_qty
-                
-                buy_orders[b_idx][1] -= trade_qty
-                sell_orders[s_idx][1] -= trade_qty
-                if buy_orders[b_idx][1] < 1e-9: b_idx += 1
-                if sell_orders[s_idx][1] < 1e-9: s_idx += 1
-            
-            # Grid Settlement for unmatched quantities
-            for i in range(b_idx, len(buy_orders)):
-                agent, rem_qty = buy_orders[i]
-                cost = rem_qty * tou
-                p2p_financials.at[index, agent] -= cost
-                metrics[agent]['p2p_net'] -= cost
-                metrics[agent]['grid_kWh'] += rem_qty
-                
-            for i in range(s_idx, len(sell_orders)):
-                agent, rem_qty = sell_orders[i]
-                rev = rem_qty * fit
-                p2p_financials.at[index, agent] += rev
-                metrics[agent]['p2p_net'] += rev
-                metrics[agent]['grid_kWh'] += rem_qty
+    df = load_order_book(input_file)
+
+    # 2. Market Clearing (vectorized over all periods)
+    matches = precompute_matches(df, dtype)
+    agent_ids = matches['agent_ids']
+    # Results are reported in float64 whatever precision the clearing ran in
+    out = settle_financials(matches, alpha).astype(np.float64, copy=False)
+
+    # Baseline (Grid-Only): buyers pay ToU on imports, sellers earn FiT on exports
+    baseline_net = (-(matches['buy'] * matches['tou'][:, None]).sum(axis=0, dtype=np.float64)
+                    + (matches['sell'] * matches['fit'][:, None]).sum(axis=0, dtype=np.float64))
+
+    # Metrics tracking for the summary report (one array per metric, indexed like agent_ids)
+    p2p_kWh = (matches['matched_b'] + matches['matched_s']).sum(axis=0, dtype=np.float64)
+    grid_kWh = (matches['grid_b'] + matches['grid_s']).sum(axis=0, dtype=np.float64)
+    p2p_net = out.sum(axis=0)
+
+    # Keep whichever metadata columns the input has, in the input's column order
+    metadata_set = set(METADATA_COLS)
+    metadata = [col for col in df.columns if col in metadata_set]
+    p2p_financials = pd.concat(
+        [df[metadata].reset_index(drop=True), pd.DataFrame(out, columns=agent_ids)], axis=1
+    )[df.columns]
 
     # 3. Build Savings Report
-    report_list = []
-    for agent in agent_ids:
-        m = metrics[agent]
-        total_vol = m['p2p_kWh'] + m['grid_kWh']
-        report_list.append({
-            'Agent': agent,
-            'Baseline Net ($)': round(m['baseline_net'], 4),
-            'P2P Net ($)': round(m['p2p_net'], 4),
-            'Savings ($)': round(m['p2p_net'] - m['baseline_net'], 4),
-            'P2P Traded (kWh)': round(m['p2p_kWh'], 2),
-            'Grid Traded (kWh)': round(m['grid_kWh'], 2),
-            'Peer Trade %': round((m['p2p_kWh'] / total_vol * 100), 2) if total_vol > 0 else 0
-        })
+    total_vol = p2p_kWh + grid_kWh
+    peer_pct = np.divide(p2p_kWh, total_vol, out=np.zeros_like(total_vol), where=total_vol > 0) * 100
+    report = pd.DataFrame({
+        'Agent': agent_ids,
+        'Baseline Net ($)': baseline_net,
+        'P2P Net ($)': p2p_net,
+        'Savings ($)': p2p_net - baseline_net,
+        'P2P Traded (kWh)': p2p_kWh,
+        'Grid Traded (kWh)': grid_kWh,
+        'Peer Trade %': peer_pct,
+    })
+    report = report.round({
+        'Baseline Net ($)': 4, 'P2P Net ($)': 4, 'Savings ($)': 4,
+        'P2P Traded (kWh)': 2, 'Grid Traded (kWh)': 2, 'Peer Trade %': 2,
+    })
 
     # 4. Save to files
-    pd.DataFrame(report_list).to_csv(report_output, index=False)
+    report.to_csv(report_output, index=False)
     p2p_financials.to_csv(p2p_output, index=False)
     print(f"Success. Files generated: {p2p_output}, {report_output}")
 
 # Execution
-run_energy_market_simulation('order_book_fake.xlsx', 'p2p_financial_results.csv', 'savings_report.csv')
\ No newline at end of file
+if __name__ == '__main__':
+    run_energy_market_simulation('order_book_fake.xlsx', 'p2p_financial_results.csv', 'savings_report.csv')
\ No newline at end of file
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from order_book_basic import precompute_matches, settle_financials
+
+ORDER_BOOK = Path(__file__).parent / 'order_book_fake.xlsx'
+
+def fcfs_financials(df, alpha=0.5):
+    # The original row-by-row FCFS loop, kept as the reference for the vectorized kernel
+    agent_ids = [col for col in df.columns if col not in ('timestamp', 'export price', 'import price')]
+    out = np.zeros((len(df), len(agent_ids)))
+    for i, (_, row) in enumerate(df.iterrows()):
+        fit = row['export price']
+        tou = row['import price']
+        if tou <= fit:
+            for j, agent in enumerate(agent_ids):
+                qty = row[agent]
+                out[i, j] = -qty * tou if qty > 0 else abs(qty) * fit
+            continue
+
+        p2p_price = fit + alpha * (tou - fit)
+        buy_orders = [[j, row[a]] for j, a in enumerate(agent_ids) if row[a] > 0]
+        sell_orders = [[j, abs(row[a])] for j, a in enumerate(agent_ids) if row[a] < 0]
+
+        b_idx, s_idx = 0, 0
+        while b_idx < len(buy_orders) and s_idx < len(sell_orders):
+            b_j, b_qty = buy_orders[b_idx]
+            s_j, s_qty = sell_orders[s_idx]
+            trade_qty = min(b_qty, s_qty)
+            out[i, b_j] -= trade_qty * p2p_price
+            out[i, s_j] += trade_qty * p2p_price
+            buy_orders[b_idx][1] -= trade_qty
+            sell_orders[s_idx][1] -= trade_qty
+            if buy_orders[b_idx][1] < 1e-9: b_idx += 1
+            if sell_orders[s_idx][1] < 1e-9: s_idx += 1
+
+        for j, rem_qty in buy_orders[b_idx:]:
+            out[i, j] -= rem_qty * tou
+        for j, rem_qty in sell_orders[s_idx:]:
+            out[i, j] += rem_qty * fit
+    return out
+
+def random_order_book(n=300, n_agents=12, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'timestamp': np.arange(n),
+        'export price': rng.integers(0, 8, n),
+        'import price': rng.integers(0, 10, n),
+    })
+    qtys = rng.normal(0, 3, (n, n_agents)).round(4)
+    qtys[rng.random((n, n_agents)) < 0.1] = 0.0
+    qtys[::7] = np.abs(qtys[::7])    # buyers only
+    qtys[::11] = -np.abs(qtys[::11]) # sellers only
+    qtys[::13] = 0.0                 # no orders at all
+    for j in range(n_agents):
+        df[j + 1] = qtys[:, j]
+    return df
+
+def check_matches_fcfs(df, alpha=0.5):
+    matches = precompute_matches(df)
+    out = settle_financials(matches, alpha)
+    expected = fcfs_financials(df, alpha)
+
+    np.testing.assert_allclose(out, expected, rtol=0, atol=1e-9)
+    # Fully matched orders leave no grid remainder and settle to an exact, positive 0.0
+    assert (matches['grid_b'] >= 0).all() and (matches['grid_s'] >= 0).all()
+    zeros = expected == 0
+    assert (out[zeros] == 0).all()
+    assert not np.signbit(out[zeros]).any()
+
+def test_bundled_order_book_matches_fcfs():
+    check_matches_fcfs(pd.read_excel(ORDER_BOOK))
+
+def test_random_order_book_matches_fcfs():
+    for alpha in (0.0, 0.5, 0.9):
+        check_matches_fcfs(random_order_book(), alpha)
+
+def test_blank_cells_are_not_orders():
+    df = random_order_book()
+    agent_ids = df.columns[3:]
+    qtys = df[agent_ids].to_numpy()
+    qtys[np.random.default_rng(1).random(qtys.shape) < 0.05] = np.nan
+    df[agent_ids] = qtys
+
+    matches = precompute_matches(df)
+    out = settle_financials(matches)
+    assert not np.isnan(out).any()
+    assert not np.isnan(matches['matched_b'] + matches['matched_s']).any()
+    np.testing.assert_allclose(out, fcfs_financials(df.fillna(0.0)), rtol=0, atol=1e-9)